@@ -6,10 +6,27 @@ Handles push notifications, price monitoring, and alert generation
 
 import os
 import json
+import hashlib
+import asyncio
+import itertools
 import logging
-from datetime import datetime, timedelta
-from flask import Flask, request, jsonify
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError, wait
+from datetime import datetime
+from pathlib import Path
+from urllib.parse import urlsplit
+from aioapns import APNs, NotificationRequest, PushType
+from celery import Celery, group
+from curl_cffi import requests as curl_requests
+from flask import Flask, Response, g, has_request_context, request, jsonify
+from flask.json.provider import DefaultJSONProvider
 from flask_cors import CORS
+from numba import njit
+import numpy as np
+import orjson
+import pandas as pd
+import redis
 import yfinance as yf
 from dotenv import load_dotenv
 
@@ -23,8 +40,21 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+
+# JSON encoding
+class OrjsonProvider(DefaultJSONProvider):
+    """Flask JSON provider backed by orjson"""
+    
+    def dumps(self, obj, **kwargs):
+        return orjson.dumps(obj, default=self.default, option=orjson.OPT_SERIALIZE_NUMPY).decode()
+    
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
+
 # Initialize Flask app
 app = Flask(__name__)
+app.json = OrjsonProvider(app)
 CORS(app)
 
 # Configuration
@@ -32,11 +62,163 @@ PORT = int(os.getenv('PORT', 8080))
 APNS_KEY_ID = os.getenv('APNS_KEY_ID')
 APNS_TEAM_ID = os.getenv('APNS_TEAM_ID')
 APNS_KEY_PATH = os.getenv('APNS_KEY_PATH')
+APNS_TOPIC = os.getenv('APNS_TOPIC', 'com.yantraworks.mystocksapp')
+APNS_USE_SANDBOX = os.getenv('APNS_USE_SANDBOX') == '1'
+APNS_ENABLED = all((APNS_KEY_ID, APNS_TEAM_ID, APNS_KEY_PATH))
+APNS_MAX_CONCURRENCY = int(os.getenv('APNS_MAX_CONCURRENCY', 500))  # streams in flight
+PUSH_BATCH_SIZE = 1000  # device tokens per Celery push task
+PUSH_TIMEOUT = float(os.getenv('PUSH_TIMEOUT', 30))
+QUOTE_TIMEOUT = float(os.getenv('QUOTE_TIMEOUT', 15))
+QUOTE_CACHE_TTL = int(os.getenv('QUOTE_CACHE_TTL', 10))
+QUOTE_CACHE_TTL_CLOSED = int(os.getenv('QUOTE_CACHE_TTL_CLOSED', 3600))
+
+# Redis (cache and persistent storage)
+R = redis.Redis(
+    host=os.getenv('REDIS_HOST', 'localhost'),
+    port=int(os.getenv('REDIS_PORT', 6379)),
+    decode_responses=True
+)
+
+# Celery (background push sends and live activity refreshes)
+# Run workers with: celery -A app.celery worker --concurrency=8
+celery = Celery(
+    'mystocks',
+    broker=os.getenv(
+        'CELERY_BROKER_URL',
+        f"redis://{os.getenv('REDIS_HOST', 'localhost')}:{os.getenv('REDIS_PORT', 6379)}/0"
+    )
+)
+celery.conf.task_ignore_result = True
+
+# Shared pool for outbound I/O (Yahoo)
+EXECUTOR = ThreadPoolExecutor(max_workers=int(os.getenv('IO_WORKERS', 16)))
+
+# Yahoo query hosts to spread requests across (yfinance only uses query1/query2)
+YAHOO_QUERY_HOSTS = os.getenv(
+    'YAHOO_QUERY_HOSTS', 'query1.finance.yahoo.com,query2.finance.yahoo.com'
+).split(',')
+YAHOO_MAX_RETRIES = 3  # extra attempts after a 429
+YAHOO_BACKOFF = 0.5  # seconds, doubled per attempt
+YAHOO_MAX_BACKOFF = 10
+
+
+class YahooSession(curl_requests.Session):
+    """Browser-impersonating session that round-robins Yahoo query API calls across hosts"""
+    
+    def __init__(self, hosts, **kwargs):
+        self.hosts = set(hosts)
+        self.host_cycle = itertools.cycle(hosts)
+        super().__init__(**kwargs)
+    
+    def request(self, method, url, *args, **kwargs):
+        parts = urlsplit(url)
+        
+        for attempt in range(YAHOO_MAX_RETRIES + 1):
+            # Each attempt, including retries, goes to the next host in the cycle
+            if parts.hostname in self.hosts:
+                url = parts._replace(netloc=next(self.host_cycle)).geturl()
+            
+            response = super().request(method, url, *args, **kwargs)
+            if response.status_code != 429 or attempt == YAHOO_MAX_RETRIES:
+                return response
+            
+            time.sleep(self.retry_delay(response, attempt))
+    
+    @staticmethod
+    def retry_delay(response, attempt):
+        """Seconds to wait before retrying a 429, honouring Retry-After"""
+        try:
+            delay = float(response.headers.get('Retry-After'))
+        except (TypeError, ValueError):
+            delay = YAHOO_BACKOFF * 2 ** attempt
+        
+        return min(max(delay, 0), YAHOO_MAX_BACKOFF)
+
+
+# Shared HTTP session so Yahoo connections, cookies and crumb are reused.
+# Yahoo throttles non-browser TLS fingerprints, so keep yfinance's curl_cffi
+# Chrome impersonation rather than a plain requests.Session.
+SESSION = YahooSession(YAHOO_QUERY_HOSTS, impersonate='chrome')
+
+# Redis keys:
+#   devices            hash   token -> device metadata (JSON)
+#   alert:meta         hash   alert id -> alert (JSON)
+#   alert:ids          zset   alert ids scored by id, for pagination
+#   alerts:{SYMBOL}    zset   alert id scored by target price
+#   alerts:next_id     string alert id counter
+DEVICES_KEY = 'devices'
+ALERT_META_KEY = 'alert:meta'
+ALERT_IDS_KEY = 'alert:ids'
+ALERT_ID_KEY = 'alerts:next_id'
+
+
+# ==================== CACHE ====================
+
+def cache_get(key):
+    """Return a cached JSON value, or None on miss or Redis failure"""
+    try:
+        cached = R.get(key)
+        R.incr('cache:hits' if cached is not None else 'cache:misses')
+    except redis.RedisError as e:
+        logger.warning(f"Cache read failed for {key}: {str(e)}")
+        return None
+    
+    return orjson.loads(cached) if cached is not None else None
+
+
+def cache_set(key, value, ttl):
+    """Store a JSON value with a TTL, ignoring Redis failures"""
+    try:
+        R.setex(key, ttl, orjson.dumps(value, option=orjson.OPT_SERIALIZE_NUMPY))
+    except redis.RedisError as e:
+        logger.warning(f"Cache write failed for {key}: {str(e)}")
+
+
+def make_etag(*parts):
+    """Short validator for a tuple of values that determine a response"""
+    return hashlib.blake2b(':'.join(map(str, parts)).encode(), digest_size=8).hexdigest()
+
+
+def conditional_response(payload, etag):
+    """Return 304 when the client already holds this ETag, else the JSON payload"""
+    if request.if_none_match.contains_weak(etag):
+        response = Response(status=304)
+    else:
+        response = jsonify(payload)
+    
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'max-age=5'
+    return response
+
+
+def quote_ttl(ticker):
+    """Short TTL while the market is trading, long TTL otherwise"""
+    try:
+        # yfinance formats the trading period bounds as tz-aware Timestamps
+        period = ticker.get_history_metadata()['currentTradingPeriod']['regular']
+        is_open = period['start'] <= pd.Timestamp.now(tz=period['start'].tz) < period['end']
+    except Exception:
+        return QUOTE_CACHE_TTL
+    
+    return QUOTE_CACHE_TTL if is_open else QUOTE_CACHE_TTL_CLOSED
+
+
+# ==================== MARKET DATA SOURCE ====================
+
+def get_ticker(symbol):
+    """Create a yfinance Ticker on the shared HTTP session"""
+    # Ticker objects memoize fast_info and history metadata, so they are
+    # cheap to build but must not be cached or prices would go stale
+    return yf.Ticker(symbol.upper(), session=SESSION)
+
+
+# ==================== REQUEST HOOKS ====================
 
-# In-memory storage for device tokens (use Redis in production)
-device_tokens = {}
-price_alerts = []
-active_monitors = {}
+@app.before_request
+def stamp_request():
+    """Take one timestamp per request for handlers to share"""
+    g.now = datetime.now()
+    g.now_iso = g.now.isoformat()
 
 
 # ==================== HEALTH CHECK ====================
@@ -46,12 +228,17 @@ def health_check():
     """Health check endpoint"""
     return jsonify({
         'status': 'healthy',
-        'timestamp': datetime.now().isoformat(),
+        'timestamp': g.now_iso,
         'version': '1.0.0'
     })
 
 
 # ==================== DEVICE REGISTRATION ====================
+def device_token_iter():
+    """Iterate registered device tokens without loading the whole hash"""
+    for token, _ in R.hscan_iter(DEVICES_KEY):
+        yield token
+
 
 @app.route('/api/devices/register', methods=['POST'])
 def register_device():
@@ -64,11 +251,11 @@ def register_device():
     token = data['token']
     user_id = data.get('user_id', 'anonymous')
     
-    device_tokens[token] = {
+    R.hset(DEVICES_KEY, token, json.dumps({
         'user_id': user_id,
-        'registered_at': datetime.now().isoformat(),
+        'registered_at': g.now_iso,
         'platform': data.get('platform', 'ios')
-    }
+    }))
     
     logger.info(f"Registered device token for user {user_id}")
     
@@ -88,8 +275,7 @@ def unregister_device():
     
     token = data['token']
     
-    if token in device_tokens:
-        del device_tokens[token]
+    if R.hdel(DEVICES_KEY, token):
         logger.info(f"Unregistered device token")
     
     return jsonify({
@@ -110,16 +296,20 @@ def create_price_alert():
         return jsonify({'error': 'Missing required fields'}), 400
     
     alert = {
-        'id': len(price_alerts) + 1,
+        'id': R.incr(ALERT_ID_KEY),
         'symbol': data['symbol'].upper(),
         'target_price': float(data['target_price']),
         'direction': data['direction'],  # 'above' or 'below'
         'device_token': data.get('device_token'),
-        'created_at': datetime.now().isoformat(),
+        'created_at': g.now_iso,
         'triggered': False
     }
     
-    price_alerts.append(alert)
+    pipe = R.pipeline()
+    pipe.hset(ALERT_META_KEY, alert['id'], json.dumps(alert))
+    pipe.zadd(ALERT_IDS_KEY, {alert['id']: alert['id']})
+    pipe.zadd(f"alerts:{alert['symbol']}", {alert['id']: alert['target_price']})
+    pipe.execute()
     
     logger.info(f"Created price alert for {alert['symbol']} at {alert['target_price']}")
     
@@ -131,17 +321,51 @@ def create_price_alert():
 
 @app.route('/api/alerts/price', methods=['GET'])
 def get_price_alerts():
-    """Get all price alerts"""
-    return jsonify({
-        'alerts': price_alerts
-    })
+    """Get price alerts a page at a time (?limit=100&cursor=<last id>)"""
+    limit = min(max(request.args.get('limit', 100, type=int), 1), 500)
+    cursor = request.args.get('cursor', 0, type=int)
+    
+    # Fetch one extra id to know whether another page follows
+    alert_ids = R.zrangebyscore(ALERT_IDS_KEY, f"({cursor}", '+inf', start=0, num=limit + 1)
+    page_ids = alert_ids[:limit]
+    # Alerts are stored as JSON already, so embed them without re-parsing
+    alerts = [orjson.Fragment(a) for a in R.hmget(ALERT_META_KEY, page_ids) if a] if page_ids else []
+    
+    return Response(
+        orjson.dumps({
+            'alerts': alerts,
+            'next_cursor': int(page_ids[-1]) if len(alert_ids) > limit else None
+        }),
+        mimetype='application/json'
+    )
+
+
+# Remove an alert from every index in one atomic round trip, so concurrent
+# deletes/updates can't interleave. The symbol's sorted set is passed in
+# KEYS (Redis requires scripts to declare every key they touch); the script
+# re-checks the alert still exists since it was read.
+DELETE_ALERT_SCRIPT = R.register_script("""
+if redis.call('HEXISTS', KEYS[1], ARGV[1]) == 0 then
+    return 0
+end
+redis.call('ZREM', KEYS[3], ARGV[1])
+redis.call('HDEL', KEYS[1], ARGV[1])
+redis.call('ZREM', KEYS[2], ARGV[1])
+return 1
+""")
 
 
 @app.route('/api/alerts/price/<int:alert_id>', methods=['DELETE'])
 def delete_price_alert(alert_id):
     """Delete a price alert"""
-    global price_alerts
-    price_alerts = [a for a in price_alerts if a['id'] != alert_id]
+    meta = R.hget(ALERT_META_KEY, alert_id)
+    
+    if meta:
+        symbol = json.loads(meta)['symbol']
+        DELETE_ALERT_SCRIPT(
+            keys=[ALERT_META_KEY, ALERT_IDS_KEY, f"alerts:{symbol}"],
+            args=[alert_id]
+        )
     
     return jsonify({
         'success': True,
@@ -151,30 +375,53 @@ def delete_price_alert(alert_id):
 
 # ==================== MARKET DATA ====================
 
+# (quote field, fast_info key, default)
+QUOTE_FIELDS = (
+    ('current_price', 'lastPrice', 0),
+    ('previous_close', 'previousClose', 0),
+    ('open', 'open', 0),
+    ('high', 'dayHigh', 0),
+    ('low', 'dayLow', 0),
+    ('volume', 'lastVolume', 0),
+    ('high_52_week', 'yearHigh', 0),
+    ('low_52_week', 'yearLow', 0),
+    ('currency', 'currency', 'USD'),
+    ('exchange', 'exchange', 'UNKNOWN'),
+)
+
+# (quote field, info keys in order of preference) for ?full=1
+FULL_QUOTE_FIELDS = (
+    ('name', ('shortName', 'longName')),
+    ('market_cap', ('marketCap',)),
+    ('pe_ratio', ('trailingPE',)),
+)
+
 @app.route('/api/quote/<symbol>', methods=['GET'])
 def get_quote(symbol):
-    """Get real-time quote for a symbol"""
+    """Get real-time quote for a symbol (?full=1 adds name, market cap and P/E)"""
+    full = request.args.get('full') == '1'
+    cache_key = f"quote:{symbol.upper()}:full" if full else f"quote:{symbol.upper()}"
+    
+    cached = cache_get(cache_key)
+    if cached is not None:
+        return conditional_response(cached, make_etag(cache_key, cached['current_price'], cached['volume']))
+    
     try:
-        ticker = yf.Ticker(symbol)
-        info = ticker.info
+        ticker = get_ticker(symbol)
+        fast_info = ticker.fast_info
         
-        quote = {
-            'symbol': symbol.upper(),
-            'name': info.get('shortName', symbol),
-            'current_price': info.get('currentPrice') or info.get('regularMarketPrice', 0),
-            'previous_close': info.get('previousClose', 0),
-            'open': info.get('open') or info.get('regularMarketOpen', 0),
-            'high': info.get('dayHigh') or info.get('regularMarketDayHigh', 0),
-            'low': info.get('dayLow') or info.get('regularMarketDayLow', 0),
-            'volume': info.get('volume') or info.get('regularMarketVolume', 0),
-            'market_cap': info.get('marketCap'),
-            'pe_ratio': info.get('trailingPE'),
-            'high_52_week': info.get('fiftyTwoWeekHigh', 0),
-            'low_52_week': info.get('fiftyTwoWeekLow', 0),
-            'currency': info.get('currency', 'USD'),
-            'exchange': info.get('exchange', 'UNKNOWN'),
-            'timestamp': datetime.now().isoformat()
-        }
+        quote = {'symbol': symbol.upper(), 'name': symbol.upper(), 'market_cap': None, 'pe_ratio': None}
+        quote.update((name, fast_info[key] or default) for name, key, default in QUOTE_FIELDS)
+        quote['timestamp'] = g.now_iso
+        
+        # The heavy info payload is only needed for descriptive fields; market
+        # cap is here too because fast_info falls back to .info without shares
+        if full:
+            info = ticker.info
+            quote.update(
+                (name, next((value for key in keys if (value := info.get(key)) is not None), quote[name]))
+                for name, keys in FULL_QUOTE_FIELDS
+            )
         
         # Calculate change
         if quote['previous_close'] > 0:
@@ -184,13 +431,61 @@ def get_quote(symbol):
             quote['change'] = 0
             quote['change_percent'] = 0
         
-        return jsonify(quote)
+        cache_set(cache_key, quote, quote_ttl(ticker))
+        
+        return conditional_response(quote, make_etag(cache_key, quote['current_price'], quote['volume']))
         
     except Exception as e:
         logger.error(f"Error fetching quote for {symbol}: {str(e)}")
         return jsonify({'error': str(e)}), 500
 
 
+def download_closes(symbols):
+    """Return {symbol: unadjusted closes over the last two sessions} via yf.download"""
+    hist = yf.download(
+        symbols, period='2d', group_by='ticker', auto_adjust=False,
+        threads=True, progress=False, session=SESSION
+    )
+    
+    closes = {}
+    for symbol in symbols:
+        try:
+            frame = hist[symbol] if isinstance(hist.columns, pd.MultiIndex) else hist
+            closes[symbol] = frame['Close'].dropna().to_numpy(dtype=np.float64)
+        except KeyError:
+            closes[symbol] = np.empty(0)
+    
+    return closes
+
+
+def fetch_quote(symbol):
+    """Fetch a lightweight quote for a symbol with a single chart request"""
+    symbol = symbol.upper()
+    
+    # The chart request returns both the closes and the metadata
+    # (currency, fallback prices), so nothing is fetched twice
+    ticker = get_ticker(symbol)
+    closes = ticker.history(period='2d', auto_adjust=False)['Close'].dropna()
+    meta = ticker.get_history_metadata()
+    
+    current_price = float(closes.iloc[-1]) if len(closes) else meta.get('regularMarketPrice')
+    previous_close = float(closes.iloc[-2]) if len(closes) >= 2 else meta.get('chartPreviousClose')
+    
+    # Unknown symbols and failed fetches come back empty; leave them out
+    # rather than report a $0 quote
+    if not current_price:
+        raise ValueError(f"No price data for {symbol}")
+    
+    return {
+        'symbol': symbol,
+        'name': symbol,
+        'current_price': current_price,
+        'previous_close': previous_close or 0,
+        'change_percent': ((current_price - previous_close) / previous_close * 100) if previous_close else 0,
+        'currency': meta.get('currency') or 'USD'
+    }
+
+
 @app.route('/api/quotes', methods=['POST'])
 def get_quotes():
     """Get quotes for multiple symbols"""
@@ -200,21 +495,20 @@ def get_quotes():
         return jsonify({'error': 'Symbols required'}), 400
     
     symbols = data['symbols']
-    quotes = []
     
-    for symbol in symbols:
+    # One chart request per symbol, all in flight at once; results are
+    # collected in request order
+    futures = [EXECUTOR.submit(fetch_quote, symbol) for symbol in symbols]
+    wait(futures, timeout=QUOTE_TIMEOUT)
+    
+    quotes = []
+    for symbol, future in zip(symbols, futures):
+        if not future.done():
+            future.cancel()
+            logger.error(f"Timed out fetching quote for {symbol}")
+            continue
         try:
-            ticker = yf.Ticker(symbol)
-            info = ticker.info
-            
-            quotes.append({
-                'symbol': symbol.upper(),
-                'name': info.get('shortName', symbol),
-                'current_price': info.get('currentPrice') or info.get('regularMarketPrice', 0),
-                'previous_close': info.get('previousClose', 0),
-                'change_percent': info.get('regularMarketChangePercent', 0),
-                'currency': info.get('currency', 'USD')
-            })
+            quotes.append(future.result())
         except Exception as e:
             logger.error(f"Error fetching quote for {symbol}: {str(e)}")
     
@@ -223,53 +517,82 @@ def get_quotes():
 
 # ==================== PATTERN DETECTION ====================
 
+# Bit flags returned by scan_patterns
+PATTERN_DOJI = 1
+PATTERN_HAMMER = 2
+
+PATTERNS = (
+    (PATTERN_DOJI, {
+        'name': 'Doji',
+        'type': 'indecision',
+        'confidence': 60,
+        'description': 'Market indecision detected'
+    }),
+    (PATTERN_HAMMER, {
+        'name': 'Hammer',
+        'type': 'bullish_reversal',
+        'confidence': 70,
+        'description': 'Potential bullish reversal'
+    }),
+)
+
+
+@njit(cache=True)
+def scan_patterns(o, h, l, c):
+    """Return a bitmask of detected candlestick patterns for every bar"""
+    flags = np.zeros(len(c), dtype=np.int64)
+    
+    for i in range(len(c)):
+        range_val = h[i] - l[i]
+        if range_val <= 0:
+            continue
+        
+        body = abs(c[i] - o[i])
+        lower_shadow = min(o[i], c[i]) - l[i]
+        upper_shadow = h[i] - max(o[i], c[i])
+        
+        flags[i] = (
+            PATTERN_DOJI * (body / range_val < 0.1)
+            | PATTERN_HAMMER * ((lower_shadow > body * 2) & (upper_shadow < body * 0.1))
+        )
+    
+    return flags
+
+
 @app.route('/api/patterns/<symbol>', methods=['GET'])
 def detect_patterns(symbol):
     """Detect candlestick patterns for a symbol"""
+    cache_key = f"patterns:{symbol.upper()}"
+    
+    cached = cache_get(cache_key)
+    if cached is not None:
+        return conditional_response(cached['result'], cached['etag'])
+    
     try:
-        ticker = yf.Ticker(symbol)
+        ticker = get_ticker(symbol)
         hist = ticker.history(period="3mo")
         
         if hist.empty:
             return jsonify({'error': 'No historical data available'}), 404
         
-        patterns = []
-        
         # Simple pattern detection (in production, use the full PatternRecognizer)
-        # Check last few candles for basic patterns
+        o, h, l, c = np.ascontiguousarray(
+            hist[['Open', 'High', 'Low', 'Close']].to_numpy(dtype=np.float64).T
+        )
+        flags = scan_patterns(o, h, l, c)
         
-        if len(hist) >= 1:
-            last = hist.iloc[-1]
-            body = abs(last['Close'] - last['Open'])
-            range_val = last['High'] - last['Low']
-            
-            if range_val > 0:
-                # Doji detection
-                if body / range_val < 0.1:
-                    patterns.append({
-                        'name': 'Doji',
-                        'type': 'indecision',
-                        'confidence': 60,
-                        'description': 'Market indecision detected'
-                    })
-                
-                # Hammer detection
-                lower_shadow = min(last['Open'], last['Close']) - last['Low']
-                upper_shadow = last['High'] - max(last['Open'], last['Close'])
-                
-                if lower_shadow > body * 2 and upper_shadow < body * 0.1:
-                    patterns.append({
-                        'name': 'Hammer',
-                        'type': 'bullish_reversal',
-                        'confidence': 70,
-                        'description': 'Potential bullish reversal'
-                    })
+        # Report patterns on the most recent candle
+        patterns = [dict(pattern) for flag, pattern in PATTERNS if flags[-1] & flag]
         
-        return jsonify({
+        result = {
             'symbol': symbol.upper(),
             'patterns': patterns,
-            'analyzed_at': datetime.now().isoformat()
-        })
+            'analyzed_at': g.now_iso
+        }
+        etag = make_etag(cache_key, c[-1], hist['Volume'].iloc[-1])
+        cache_set(cache_key, {'etag': etag, 'result': result}, quote_ttl(ticker))
+        
+        return conditional_response(result, etag)
         
     except Exception as e:
         logger.error(f"Error detecting patterns for {symbol}: {str(e)}")
@@ -278,10 +601,112 @@ def detect_patterns(symbol):
 
 # ==================== PUSH NOTIFICATIONS ====================
 
-def send_push_notification(token, title, body, data=None):
+# One HTTP/2 APNs client per topic per process, all driven by a single
+# background event loop. Created lazily so gunicorn/Celery forks don't
+# inherit the loop thread.
+apns_loop = None
+apns_key = None
+apns_clients = {}
+apns_lock = threading.Lock()
+
+
+def get_apns_client(topic):
+    """Return the APNs client for a topic, starting the event loop on first use"""
+    global apns_loop, apns_key
+    
+    with apns_lock:
+        if apns_loop is None:
+            apns_loop = asyncio.new_event_loop()
+            threading.Thread(target=apns_loop.run_forever, name='apns', daemon=True).start()
+        
+        if topic not in apns_clients:
+            # aioapns signs the JWT with the key contents, not a path
+            if apns_key is None:
+                apns_key = Path(APNS_KEY_PATH).read_text()
+            
+            async def connect():
+                return APNs(
+                    key=apns_key,
+                    key_id=APNS_KEY_ID,
+                    team_id=APNS_TEAM_ID,
+                    topic=topic,
+                    use_sandbox=APNS_USE_SANDBOX
+                )
+            
+            apns_clients[topic] = asyncio.run_coroutine_threadsafe(connect(), apns_loop).result()
+        
+        return apns_clients[topic]
+
+
+async def apns_send(client, pushes, push_type):
+    """Send (token, message) pairs, multiplexed over the client's connections"""
+    semaphore = asyncio.Semaphore(APNS_MAX_CONCURRENCY)
+    
+    async def send_one(token, message):
+        async with semaphore:
+            result = await client.send_notification(
+                NotificationRequest(device_token=token, message=message, push_type=push_type)
+            )
+            if not result.is_successful:
+                logger.warning(f"APNs rejected push to {token[:8]}...: {result.description}")
+            return result.is_successful
+    
+    results = await asyncio.gather(*(send_one(t, m) for t, m in pushes), return_exceptions=True)
+    
+    for (token, _), result in zip(pushes, results):
+        if isinstance(result, Exception):
+            logger.error(f"APNs push to {token[:8]}... failed: {result!r}")
+    
+    return sum(1 for r in results if r is True)
+
+
+def push_messages(pushes, push_type=PushType.ALERT, topic=APNS_TOPIC):
+    """Send a list of (token, APNs payload) pairs, returning the number delivered"""
+    if not APNS_ENABLED:
+        logger.info(f"APNs not configured, skipping push to {len(pushes)} device(s)")
+        return 0
+    
+    client = get_apns_client(topic)
+    future = asyncio.run_coroutine_threadsafe(apns_send(client, pushes, push_type), apns_loop)
+    
+    try:
+        return future.result(timeout=PUSH_TIMEOUT)
+    except FutureTimeoutError:
+        future.cancel()
+        logger.error(f"Timed out pushing to {len(pushes)} device(s) after {PUSH_TIMEOUT}s")
+        return 0
+
+
+def push_message(tokens, message, push_type=PushType.ALERT, topic=APNS_TOPIC):
+    """Send one APNs payload to a list of device tokens, returning the number delivered"""
+    return push_messages([(token, message) for token in tokens], push_type, topic)
+
+
+def alert_message(title, body, data=None):
+    """Build an APNs alert payload; custom data rides alongside 'aps'"""
+    # Custom data must not replace the alert itself
+    custom = {key: value for key, value in (data or {}).items() if key != 'aps'}
+    
+    return {
+        'aps': {
+            'alert': {'title': title, 'body': body},
+            'sound': 'default'
+        },
+        **custom
+    }
+
+
+def chunked(items, size):
+    """Yield lists of up to size items"""
+    iterator = iter(items)
+    while chunk := list(itertools.islice(iterator, size)):
+        yield chunk
+
+
+def send_push_notification(token, title, body, data=None, now_iso=None):
     """Send push notification to a device"""
-    # In production, use APNs or Firebase
-    # This is a placeholder implementation
+    if now_iso is None:
+        now_iso = g.now_iso if has_request_context() else datetime.now().isoformat()
     
     logger.info(f"Sending push notification: {title} - {body}")
     
@@ -290,16 +715,21 @@ def send_push_notification(token, title, body, data=None):
         'title': title,
         'body': body,
         'data': data or {},
-        'sent_at': datetime.now().isoformat()
+        'sent_at': now_iso
     }
     
-    # TODO: Implement actual APNs/FCM sending
-    # from apns2.client import APNsClient
-    # from apns2.payload import Payload
+    push_message([token], alert_message(title, body, data))
     
     return notification
 
 
+@celery.task
+def send_push_batch(tokens, message):
+    """Send the same prebuilt APNs payload to a batch of device tokens"""
+    sent = push_message(tokens, message)
+    logger.info(f"Pushed {message['aps']['alert']['title']!r} to {sent}/{len(tokens)} device(s)")
+
+
 @app.route('/api/notifications/send', methods=['POST'])
 def send_notification():
     """Send a push notification"""
@@ -308,6 +738,9 @@ def send_notification():
     if not data or 'token' not in data:
         return jsonify({'error': 'Token required'}), 400
     
+    if not isinstance(data.get('data') or {}, dict):
+        return jsonify({'error': 'data must be an object'}), 400
+    
     notification = send_push_notification(
         token=data['token'],
         title=data.get('title', 'MyStocksApp'),
@@ -329,13 +762,17 @@ def broadcast_notification():
     if not data:
         return jsonify({'error': 'Data required'}), 400
     
-    title = data.get('title', 'MyStocksApp')
-    body = data.get('body', '')
+    if not isinstance(data.get('data') or {}, dict):
+        return jsonify({'error': 'data must be an object'}), 400
+    
+    message = alert_message(data.get('title', 'MyStocksApp'), data.get('body', ''), data.get('data'))
     
     sent_count = 0
-    for token in device_tokens.keys():
-        send_push_notification(token, title, body, data.get('data'))
-        sent_count += 1
+    batches = []
+    for tokens in chunked(device_token_iter(), PUSH_BATCH_SIZE):
+        batches.append(send_push_batch.s(tokens, message))
+        sent_count += len(tokens)
+    group(batches).apply_async()
     
     return jsonify({
         'success': True,
@@ -345,6 +782,16 @@ def broadcast_notification():
 
 # ==================== TRADING ALERTS ====================
 
+ALERT_EMOJI = {
+    'NO-BRAINER BUY': '🚨',
+    'STRONG BUY': '🟢',
+    'BUY': '🟡',
+    'HOLD': '⚪',
+    'REDUCE': '🟠',
+    'SELL': '🔴'
+}
+
+
 @app.route('/api/alerts/trading', methods=['POST'])
 def create_trading_alert():
     """Create a trading alert (buy/sell recommendation)"""
@@ -355,7 +802,7 @@ def create_trading_alert():
         return jsonify({'error': 'Missing required fields'}), 400
     
     alert = {
-        'id': f"alert_{datetime.now().strftime('%Y%m%d%H%M%S')}",
+        'id': f"alert_{g.now.strftime('%Y%m%d%H%M%S')}",
         'symbol': data['symbol'].upper(),
         'alert_type': data['alert_type'],  # BUY, SELL, HOLD, etc.
         'confidence': int(data['confidence']),
@@ -365,26 +812,21 @@ def create_trading_alert():
         'stop_loss': data.get('stop_loss'),
         'suggested_shares': data.get('suggested_shares'),
         'suggested_amount': data.get('suggested_amount'),
-        'created_at': datetime.now().isoformat()
+        'created_at': g.now_iso
     }
     
-    # Send push notifications to all devices
-    for token in device_tokens.keys():
-        emoji = {
-            'NO-BRAINER BUY': '🚨',
-            'STRONG BUY': '🟢',
-            'BUY': '🟡',
-            'HOLD': '⚪',
-            'REDUCE': '🟠',
-            'SELL': '🔴'
-        }.get(alert['alert_type'], '📊')
-        
-        send_push_notification(
-            token=token,
-            title=f"{emoji} {alert['alert_type']}: {alert['symbol']}",
-            body=f"{alert['reason']} (Confidence: {alert['confidence']}%)",
-            data={'alert_id': alert['id'], 'symbol': alert['symbol']}
-        )
+    # Queue push notifications to all devices, building the payload once
+    emoji = ALERT_EMOJI.get(alert['alert_type'], '📊')
+    message = alert_message(
+        title=f"{emoji} {alert['alert_type']}: {alert['symbol']}",
+        body=f"{alert['reason']} (Confidence: {alert['confidence']}%)",
+        data={'alert_id': alert['id'], 'symbol': alert['symbol']}
+    )
+    
+    group(
+        send_push_batch.s(tokens, message)
+        for tokens in chunked(device_token_iter(), PUSH_BATCH_SIZE)
+    ).apply_async()
     
     logger.info(f"Created trading alert: {alert['alert_type']} for {alert['symbol']}")
     
@@ -396,48 +838,151 @@ def create_trading_alert():
 
 # ==================== LIVE ACTIVITY UPDATES ====================
 
-@app.route('/api/liveactivity/update', methods=['POST'])
-def update_live_activity():
-    """Update a Live Activity with new price data"""
-    data = request.get_json()
+# Redis keys:
+#   liveactivity:symbols           set    symbols with at least one subscriber
+#   liveactivity:{SYMBOL}          zset   push token scored by expiry time
+#   liveactivity:refresh:lock      string held while a refresh runs
+LIVE_ACTIVITY_SYMBOLS_KEY = 'liveactivity:symbols'
+LIVE_ACTIVITY_TOPIC = f"{APNS_TOPIC}.push-type.liveactivity"
+LIVE_ACTIVITY_INTERVAL = float(os.getenv('LIVE_ACTIVITY_INTERVAL', 5))
+LIVE_ACTIVITY_TTL = 8 * 60 * 60  # iOS ends Live Activities after 8 hours
+LIVE_ACTIVITY_LOCK_KEY = 'liveactivity:refresh:lock'
+LIVE_ACTIVITY_LOCK_TTL = int(PUSH_TIMEOUT) + 60  # longest a refresh should take
+
+
+# Forget a symbol only if it still has no subscribers, so a token registered
+# since the refresh read the set isn't orphaned
+PRUNE_LIVE_ACTIVITY_SYMBOL_SCRIPT = R.register_script("""
+if redis.call('ZCARD', KEYS[2]) == 0 then
+    return redis.call('SREM', KEYS[1], ARGV[1])
+end
+return 0
+""")
+
+
+@njit(cache=True)
+def live_activity_stats(current_prices, previous_closes):
+    """Return (price changes, percent changes) against the previous closes"""
+    changes = current_prices - previous_closes
+    percents = np.zeros_like(changes)
     
-    if not data or 'push_token' not in data or 'symbol' not in data:
-        return jsonify({'error': 'push_token and symbol required'}), 400
+    for i in range(len(changes)):
+        if previous_closes[i] > 0:
+            percents[i] = changes[i] / previous_closes[i] * 100
+    
+    return changes, percents
+
+
+# Compile at import so the first refresh doesn't pay for it
+live_activity_stats(np.ones(1), np.ones(1))
+
+
+def push_live_activity_updates():
+    """Fetch every subscribed symbol once and fan the update out to its Live Activities"""
+    now = datetime.now()
+    
+    # Drop expired subscriptions before deciding what to fetch
+    pipe = R.pipeline()
+    symbols = sorted(R.smembers(LIVE_ACTIVITY_SYMBOLS_KEY))
+    for symbol in symbols:
+        pipe.zremrangebyscore(f"liveactivity:{symbol}", '-inf', now.timestamp())
+        pipe.zrange(f"liveactivity:{symbol}", 0, -1)
+    results = pipe.execute()[1::2]
+    
+    subscribers = {symbol: tokens for symbol, tokens in zip(symbols, results) if tokens}
+    for symbol in set(symbols) - set(subscribers):
+        PRUNE_LIVE_ACTIVITY_SYMBOL_SCRIPT(keys=[LIVE_ACTIVITY_SYMBOLS_KEY, f"liveactivity:{symbol}"], args=[symbol])
+    if not subscribers:
+        return
     
-    # Get current price
     try:
-        ticker = yf.Ticker(data['symbol'])
-        info = ticker.info
-        
-        current_price = info.get('currentPrice') or info.get('regularMarketPrice', 0)
-        previous_close = info.get('previousClose', 0)
-        
+        closes_by_symbol = download_closes(list(subscribers))
+    except Exception as e:
+        logger.error(f"Error fetching live activity prices: {str(e)}")
+        return
+    
+    # Symbols need a current and previous close to report a change
+    priced = [symbol for symbol in subscribers if len(closes_by_symbol[symbol]) >= 2]
+    if not priced:
+        return
+    
+    current_prices = np.array([closes_by_symbol[symbol][-1] for symbol in priced])
+    previous_closes = np.array([closes_by_symbol[symbol][-2] for symbol in priced])
+    changes, percents = live_activity_stats(current_prices, previous_closes)
+    
+    pushes = []
+    for symbol, current_price, change, percent in zip(priced, current_prices, changes, percents):
         update_payload = {
             'aps': {
-                'timestamp': int(datetime.now().timestamp()),
+                'timestamp': int(now.timestamp()),
                 'event': 'update',
                 'content-state': {
-                    'currentPrice': current_price,
-                    'priceChange': current_price - previous_close,
-                    'priceChangePercent': ((current_price - previous_close) / previous_close * 100) if previous_close > 0 else 0,
-                    'lastUpdated': datetime.now().isoformat()
+                    'currentPrice': float(current_price),
+                    'priceChange': float(change),
+                    'priceChangePercent': float(percent),
+                    'lastUpdated': now.isoformat()
                 }
             }
         }
-        
-        # TODO: Send via APNs with push-type: liveactivity
-        
-        return jsonify({
-            'success': True,
-            'payload': update_payload
-        })
-        
-    except Exception as e:
-        return jsonify({'error': str(e)}), 500
+        pushes.extend((token, update_payload) for token in subscribers[symbol])
+    
+    sent = push_messages(pushes, PushType.LIVEACTIVITY, LIVE_ACTIVITY_TOPIC)
+    logger.info(f"Live activity refresh: {len(priced)} symbol(s), {sent}/{len(pushes)} update(s) delivered")
+
+
+@celery.task
+def refresh_live_activities():
+    """Periodic Live Activity refresh; skipped while a previous run still holds the lock"""
+    # A run can outlast the interval (download plus up to PUSH_TIMEOUT of
+    # pushes), so overlapping runs would send duplicate updates
+    lock = R.lock(LIVE_ACTIVITY_LOCK_KEY, timeout=LIVE_ACTIVITY_LOCK_TTL, blocking=False)
+    if not lock.acquire():
+        logger.info("Live activity refresh still running, skipping this tick")
+        return
+    
+    try:
+        push_live_activity_updates()
+    finally:
+        try:
+            lock.release()
+        except redis.exceptions.LockError:
+            logger.warning("Live activity refresh outlived its lock")
+
+
+celery.conf.beat_schedule = {
+    'refresh-live-activities': {
+        'task': refresh_live_activities.name,
+        'schedule': LIVE_ACTIVITY_INTERVAL,
+        # Drop ticks queued while no worker was running instead of replaying them
+        'options': {'expires': LIVE_ACTIVITY_INTERVAL}
+    }
+}
+
+
+@app.route('/api/liveactivity/update', methods=['POST'])
+def update_live_activity():
+    """Subscribe a Live Activity to periodic price updates for a symbol"""
+    data = request.get_json()
+    
+    if not data or 'push_token' not in data or 'symbol' not in data:
+        return jsonify({'error': 'push_token and symbol required'}), 400
+    
+    symbol = data['symbol'].upper()
+    
+    pipe = R.pipeline()
+    pipe.zadd(f"liveactivity:{symbol}", {data['push_token']: g.now.timestamp() + LIVE_ACTIVITY_TTL})
+    pipe.sadd(LIVE_ACTIVITY_SYMBOLS_KEY, symbol)
+    pipe.execute()
+    
+    return jsonify({
+        'success': True,
+        'subscribed': True
+    }), 202
 
 
 # ==================== MAIN ====================
 
 if __name__ == '__main__':
     logger.info(f"Starting MyStocksApp Backend on port {PORT}")
-    app.run(host='0.0.0.0', port=PORT, debug=True)
+    # Development server only; production runs under gunicorn (gunicorn_conf.py)
+    app.run(host='0.0.0.0', port=PORT, debug=os.getenv('FLASK_DEBUG') == '1')
@@ -0,0 +1,19 @@
+"""
+Gunicorn configuration for MyStocksApp Backend
+Usage: gunicorn -c gunicorn_conf.py app:app
+"""
+
+import os
+
+bind = f"0.0.0.0:{os.getenv('PORT', 8080)}"
+
+# Requests spend most of their time waiting on Yahoo and Redis, so use
+# threaded workers. Avoid monkey-patching workers (gevent/eventlet): they
+# conflict with the background asyncio loop thread used for APNs pushes.
+workers = int(os.getenv('GUNICORN_WORKERS', (os.cpu_count() or 1) * 2))
+worker_class = 'gthread'
+threads = int(os.getenv('GUNICORN_THREADS', 16))
+timeout = int(os.getenv('GUNICORN_TIMEOUT', 60))
+
+accesslog = '-'
+errorlog = '-'